@@ -1,78 +1,130 @@
+import re
 import sys
+from itertools import islice
 from instructions import Format1, Format2, Format3, Format4
-from instructions import OpTable, extended, sic_format
-from error import DuplicateSymbolError, LineFieldsError, OpcodeLookupError, InputError
-from records import outputLST, generate_records
+from instructions import OpTable, flagTable, extended, sic_format, select_isa
+from isa import MEMORY, operand_count, default_path
+from error import Error, DuplicateSymbolError, LineFieldsError, OpcodeLookupError, InputError
+from error import ErrorLimitError, InstructionError
+from records import outputLST, generate_records, ListingWriter, ObjectWriter
+from intermediate import IntermediateFile, IMMEDIATE, INDIRECT, INDEXED
+from diagnostics import Diagnostics
+from delta import load_object, generate_delta
+from xref import CrossReference, mode_name
+from batch import record_table, symbol_values, encode_rows
 
 symtab = {}
+xref = CrossReference()
 base = None
 start_addr = 0
 program_length = 0
 program_name = ""
 asmlines = []
+# intermediate records per numpy batch, so programs are encoded in bounded chunks
+batch_size = 4096
+options = ['intermediate', 'diagnostics', 'maxerrors', 'previous', 'isa', 'isafile', 'backend']
 
 
 def open_file():
-    if len(sys.argv) != 3:
+    if len(sys.argv) < 3:
         raise InputError(
             "\nInput Error! Input example:\n" +
             "SIC mode: FILENAME.ASM -sic\n" +
-            "SIC/XE mode:FILENAME.ASM -sicxe")
+            "SIC/XE mode:FILENAME.ASM -sicxe\n" +
+            "Options: -intermediate -diagnostics -maxerrors=N -previous=FILENAME.OBJ\n" +
+            "         -isa=NAME -isafile=FILENAME.JSON -backend=python|numpy")
     elif not sys.argv[1].lower().endswith('.asm'):
         raise InputError("File format should be .asm")
     elif sys.argv[2][1:] != 'sic' and sys.argv[2][1:] != 'sicxe':
         raise InputError("Input Mode Error.")
+    elif any(x[1:].partition('=')[0] not in options for x in sys.argv[3:]):
+        raise InputError("Unknown option. Available options: " +
+                         "-intermediate -diagnostics -maxerrors=N -previous=FILENAME.OBJ " +
+                         "-isa=NAME -isafile=FILENAME.JSON -backend=python|numpy")
     else:
         filename = sys.argv[1][:-4]
         mode = sys.argv[2][1:]
+        selected = dict(x[1:].partition('=')[::2] for x in sys.argv[3:])
 
         if mode != 'sic' or mode != 'sicxe':
             print()
         try:
-            with open(sys.argv[1]) as f:
-                asmlines = f.readlines()
-                # remove comments
-                asmlines = [x[:x.find('.')].strip() for x in asmlines]
-                # remove empty elements and split lines with tabs
-                asmlines = [x.split() for x in asmlines if x is not '']
-
-                return filename, mode, asmlines
+            with open(sys.argv[1]):
+                pass
         except IOError:
             print("Cannot find the file!")
+        else:
+            return filename, mode, selected, read_source(sys.argv[1])
+
+
+def read_source(path):
+    with open(path) as f:
+        for lineno, x in enumerate(f, 1):
+            # remove comments
+            if '.' in x:
+                x = x[:x.find('.')]
+            # remove empty elements and split lines with tabs
+            fields = list(re.finditer(r'\S+', x))
+            if fields:
+                yield [m.group() for m in fields], lineno, [m.start()+1 for m in fields]
 
 
 class srcline(object):
-    def __init__(self, label, mnemonic, operand):
+    def __init__(self, label, mnemonic, operand, lineno=None, columns=(None, None, None)):
         self.label = label
         self.mnemonic = mnemonic
         self.operand = operand
         self.location = None
+        self.lineno = lineno
+        # source columns of the label, mnemonic and operand fields
+        self.columns = tuple(columns)
+
+    def parse(line, lineno=None, columns=None):
+        if columns is None:
+            columns = [None] * len(line)
 
-    def parse(line):
         if len(line) > 1 and ',' in line[len(line)-1]:
             operands = line[len(line)-1].split(',')
         elif len(line) > 1:
             operands = line[len(line)-1]
 
         if len(line) is 3:
-            return srcline(label=line[0], mnemonic=line[1], operand=operands)
+            return srcline(label=line[0], mnemonic=line[1], operand=operands,
+                           lineno=lineno, columns=columns)
 
         elif len(line) is 2:
-            return srcline(label=None, mnemonic=line[0], operand=operands)
+            return srcline(label=None, mnemonic=line[0], operand=operands,
+                           lineno=lineno, columns=[None] + columns)
 
         elif len(line) is 1:
-            return srcline(label=None, mnemonic=line[0], operand=None)
+            return srcline(label=None, mnemonic=line[0], operand=None,
+                           lineno=lineno, columns=[None] + columns + [None])
 
         else:
-            raise LineFieldsError('Invalid amount of fields on line: ', line)
+            error = LineFieldsError('Invalid amount of fields on line: {}'.format(' '.join(line)))
+            error.line, error.column = lineno, columns[0]
+            raise error
 
 
-def first_pass(asmlines):
+def parse_lines(data, diagnostics=None):
+    for line in data:
+        try:
+            yield srcline.parse(*line)
+        except LineFieldsError as e:
+            if diagnostics is None:
+                raise
+            diagnostics.record(e)
+
+
+def first_pass(asmlines, intfile=None, diagnostics=None):
     global start_addr
     global program_name
 
-    firstline = asmlines[0]
+    asmlines = iter(asmlines)
+    firstline = next(asmlines)
     displayLine(firstline)
+    if intfile is not None:
+        intfile.write(firstline)
 
     # read first line and check 'START' opcode
     if firstline.mnemonic is not None:
@@ -83,14 +135,18 @@ def first_pass(asmlines):
         else:
             locctr = 0
 
-    for line in asmlines[1:]:
+    for line in asmlines:
         displayLine(line)
         line.location = locctr
+        if intfile is not None:
+            intfile.write(line)
         if line.label is not None:
             if line.label not in symtab:
                 symtab[line.label] = hex(locctr)
+                xref.define(line.label, line)
             else:
-                raise DuplicateSymbolError('A duplicate symbol was found: {}'.format(line.label))
+                report(DuplicateSymbolError('A duplicate symbol was found: {}'.format(line.label)),
+                       line, diagnostics)
 
         mnemonic = base_mnemonic(line.mnemonic)
         # Search OpTable for mnemonic
@@ -113,64 +169,150 @@ def first_pass(asmlines):
                 value = value.replace("'", '')
                 locctr += len(value)
             else:
-                raise LineFieldsError('Invalid value for BYTE: {}'.format(line.operand))
+                report(LineFieldsError('Invalid value for BYTE: {}'.format(line.operand)),
+                       line, diagnostics)
         elif mnemonic == 'END':
             break
         elif mnemonic == 'BASE':
             pass
         else:
-            raise OpcodeLookupError('The mnemonic "{}" is invalid.'.format(line.mnemonic))
+            report(OpcodeLookupError('The mnemonic "{}" is invalid.'.format(line.mnemonic)),
+                   line, diagnostics)
 
 
-def second_pass(asmlines, mode):
-    global base
-    object_code = []
+def report(error, line, diagnostics):
+    if diagnostics is None:
+        raise error
+    diagnostics.record(error, line)
+
+
+def load_lines(intfile):
+    for location, label, mnemonic, operand, lineno, columns in intfile:
+        line = srcline(label=label, mnemonic=mnemonic, operand=operand,
+                       lineno=lineno, columns=columns)
+        line.location = location
+        yield line
+
+
+def second_pass(asmlines, mode, diagnostics=None):
+    return [(line.location, obj) for line, obj in
+            encode_lines(asmlines, mode, diagnostics) if obj is not None]
 
+
+def encode_lines(asmlines, mode, diagnostics=None):
     for line in asmlines:
-        if OpTable.get(base_mnemonic(line.mnemonic)):
+        yield line, encode_line(line, mode, diagnostics)
+
+
+def encode_line(line, mode, diagnostics=None):
+    global base
+    obj = None
+    instr = OpTable.get(base_mnemonic(line.mnemonic))
+    reference(line, instr)
+
+    if instr:
+        try:
             if mode == 'sicxe':
                 instr_format = determine_format(line.mnemonic)
-                instr_output = generate_instruction(instr_format, line)
+                obj = generate_instruction(instr_format, line)
+                if diagnostics is not None:
+                    obj.generate()
             else:
-                instr_output = sic_format(symtab, line.mnemonic, line.operand)
-            object_code.append((line.location, instr_output))
-        else:
-            if line.mnemonic == 'WORD':
-                hex_value = hex(int(line.operand, 16))
-                stripped = hex_value.lstrip('0x')
-                padded = stripped.zfill(6)
-                output = (line.mnemonic, line.operand, padded)
-                object_code.append((line.location, output))
-            elif line.mnemonic == 'BYTE':
-                if line.operand.startswith('X'):
-                    value = line.operand.replace('X', '')
-                    stripped = value.replace("'", '')
-                    output = (line.mnemonic, line.operand, stripped)
-                    object_code.append((line.location, output))
-                elif line.operand.startswith('C'):
-                    value = line.operand.replace('C', '')
-                    stripped = value.replace("'", '')
-                    hex_value = ''
-                    for c in stripped:
-                        hex_value += format(ord(c), 'x').upper()
-                    output = (line.mnemonic, line.operand, hex_value)
-                    object_code.append((line.location, output))
-            elif line.mnemonic == 'BASE':
-                base = symtab.get(line.operand)
-            elif line.mnemonic == 'NOBASE':
-                base = None
-
-    return object_code
+                obj = sic_format(symtab, line.mnemonic, line.operand)
+        except Error as e:
+            report(e, line, diagnostics)
+            obj = (line.mnemonic, line.operand, '')
+    else:
+        if line.mnemonic == 'WORD':
+            hex_value = hex(int(line.operand, 16))
+            stripped = hex_value.lstrip('0x')
+            padded = stripped.zfill(6)
+            obj = (line.mnemonic, line.operand, padded)
+        elif line.mnemonic == 'BYTE':
+            if line.operand.startswith('X'):
+                value = line.operand.replace('X', '')
+                stripped = value.replace("'", '')
+                obj = (line.mnemonic, line.operand, stripped)
+            elif line.operand.startswith('C'):
+                value = line.operand.replace('C', '')
+                stripped = value.replace("'", '')
+                hex_value = ''
+                for c in stripped:
+                    hex_value += format(ord(c), 'x').upper()
+                obj = (line.mnemonic, line.operand, hex_value)
+        elif line.mnemonic == 'BASE':
+            base = symtab.get(line.operand)
+        elif line.mnemonic == 'NOBASE':
+            base = None
+
+    return obj
+
+
+def reference(line, instr):
+    if (instr and instr.shape == MEMORY) or line.mnemonic in ('BASE', 'END'):
+        xref.reference(line)
+
+
+def encode_records(intfile, mode, listing, records, diagnostics=None):
+    # numpy backend: Format 3/4 lines are encoded a chunk of intermediate
+    # records at a time and their packed words go straight into the text
+    # records; every other line goes through encode_line()
+    table = record_table(intfile)
+    values = symbol_values(intfile.names, symtab)
+    ids = dict((name, k) for k, name in enumerate(intfile.names, 1))
+    base_ids = ids.get('BASE', -1), ids.get('NOBASE', -1)
+    # the cross-reference takes the symbol and addressing mode of the records
+    instrs = [OpTable.get(base_mnemonic(x)) for x in intfile.names]
+    memory = [False] + [x is not None and x.shape == MEMORY for x in instrs]
+    lines = load_lines(intfile)
+
+    for start in range(0, len(table), batch_size):
+        rows = table[start:start+batch_size]
+        chunk_base = -1 if base is None else int(str(base), 16)
+        encoded = encode_rows(rows, values, chunk_base, base_ids)
+        fast = encoded.fast.tolist()
+        failed, no_base = encoded.failed.tolist(), encoded.no_base.tolist()
+        words, sizes = encoded.words.tolist(), encoded.sizes.tolist()
+        offsets, relocate = encoded.offsets.tolist(), encoded.relocate.tolist()
+        mnemonics, symbols = rows['mnemonic'].tolist(), rows['symbol'].tolist()
+        modes, formats = rows['mode'].tolist(), rows['format'].tolist()
+        k = 0
+
+        for row, line in enumerate(islice(lines, len(rows))):
+            if not fast[row]:
+                obj = encode_line(line, mode, diagnostics)
+                listing.add(line, obj)
+                if obj is not None:
+                    records.add(line.location, obj)
+                continue
+
+            if symbols[row] and memory[mnemonics[row]]:
+                bits = modes[row]
+                xref.add(intfile.names[symbols[row]-1], line.lineno, mode_name(
+                    bits & INDEXED, bits & IMMEDIATE, bits & INDIRECT, formats[row] == 4))
+            if failed[k]:
+                if no_base[k]:
+                    error = InstructionError('BASE directive has not been not set.')
+                else:
+                    error = InstructionError('Neither PC relative or Base relative could be used.')
+                report(error, line, diagnostics)
+                obj = (line.mnemonic, line.operand, '')
+                listing.add(line, obj)
+                records.add(line.location, obj)
+            else:
+                listing.add(line, (line.mnemonic, None, format(words[k], '0{}X'.format(2*sizes[k]))))
+                records.add_data(line.location, encoded.data, offsets[k], offsets[k]+sizes[k], relocate[k])
+            k += 1
 
 
 def generate_instruction(instr_format, line):
     if instr_format is 1:
         instruction = Format1(mnemonic=line.mnemonic)
     elif instr_format is 2:
-        op_num = OpTable[line.mnemonic].operands
-        if len(op_num) == 2:
+        op_num = operand_count[OpTable[line.mnemonic].shape]
+        if op_num == 2:
             r1, r2 = line.operand[0], line.operand[1]
-        elif len(op_num) == 1:
+        elif op_num == 1:
             r1, r2 = line.operand, None
         instruction = Format2(mnemonic=line.mnemonic, r1=r1, r2=r2)
     elif instr_format is 3:
@@ -210,17 +352,83 @@ def displayLine(line):
 
 
 if __name__ == '__main__':
-    filename, mode, data = open_file()
-    for line in data:
-        asmlines.append(srcline.parse(line))
-
-    print('===================== First Pass =======================')
-    first_pass(asmlines)
-    print('\n===================== Symbol Table =====================')
-    for sym, val in symtab.items():
-        print(sym.rjust(8), val.rjust(10))
-    print('\n===================== Second Pass =======================')
-
-    object_code = second_pass(asmlines, mode)
-    outputLST(filename, start_addr, asmlines, object_code, mode)
-    generate_records(filename, program_name, start_addr, object_code, symtab, mode)
+    filename, mode, selected, data = open_file()
+    backend = selected.get('backend') or 'python'
+    if backend not in ('python', 'numpy'):
+        raise InputError("Backend should be python or numpy.")
+    # the instruction set defaults to the one named after the mode
+    select_isa(selected.get('isa') or mode, selected.get('isafile') or default_path)
+    if mode == 'sicxe' and any(x not in flagTable for x in 'nixbpe'):
+        raise InputError("The instruction set does not define the nixbpe flags SIC/XE mode needs.")
+
+    if 'maxerrors' in selected and 'diagnostics' not in selected:
+        raise InputError("-maxerrors can only be used with -diagnostics.")
+    elif not (selected.get('maxerrors') or '100').isdigit() or int(selected.get('maxerrors') or 100) < 1:
+        raise InputError("-maxerrors should be a positive number of errors.")
+
+    if 'diagnostics' in selected:
+        diagnostics = Diagnostics(limit=int(selected.get('maxerrors') or 100))
+    else:
+        diagnostics = None
+
+    # read before the new object file can overwrite it
+    previous = load_object(selected['previous']) if 'previous' in selected else None
+
+    if 'intermediate' in selected or backend == 'numpy':
+        # lines are streamed through a temporary file instead of asmlines;
+        # the numpy backend reads its classified records as arrays
+        intfile = IntermediateFile()
+        lines = parse_lines(data, diagnostics)
+    else:
+        intfile = None
+        lines = asmlines
+
+    listing, records = None, None
+    try:
+        if intfile is None:
+            asmlines.extend(parse_lines(data, diagnostics))
+        print('===================== First Pass =======================')
+        first_pass(lines, intfile, diagnostics)
+        print('\n===================== Symbol Table =====================')
+        for sym, val in symtab.items():
+            print(sym.rjust(8), val.rjust(10))
+        print('\n===================== Second Pass =======================')
+
+        if intfile is not None:
+            # listing and object records are written as the lines are encoded
+            listing = ListingWriter(filename, start_addr, mode)
+            records = ObjectWriter(filename, program_name, start_addr, mode)
+            # SIC instructions have no Format 3/4 words to vectorize
+            if backend == 'numpy' and mode == 'sicxe':
+                encode_records(intfile, mode, listing, records, diagnostics)
+            else:
+                for line, obj in encode_lines(load_lines(intfile), mode, diagnostics):
+                    listing.add(line, obj)
+                    if obj is not None:
+                        records.add(line.location, obj)
+        else:
+            object_code = second_pass(lines, mode, diagnostics)
+    except ErrorLimitError:
+        pass
+
+    if intfile is not None:
+        intfile.close()
+
+    if diagnostics is not None and diagnostics.errors:
+        if listing is not None:
+            listing.discard()
+            records.discard()
+        print('\n===================== Diagnostics =======================')
+        diagnostics.output(filename)
+        sys.exit(1)
+    else:
+        if intfile is not None:
+            listing.close(xref.output(symtab))
+            records.close()
+        else:
+            outputLST(filename, start_addr, lines, object_code, mode, xref.output(symtab))
+            generate_records(filename, program_name, start_addr, object_code, symtab, mode)
+        if previous is not None:
+            patch = generate_delta(filename, previous)
+            print('\n{} changed and {} deleted byte(s) written to {}.patch'.format(
+                len(patch.memory), len(patch.deleted), filename))
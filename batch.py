@@ -0,0 +1,145 @@
+from error import InputError
+from instructions import flagTable
+from intermediate import record, no_value, IMMEDIATE, INDIRECT, INDEXED, LITERAL
+
+
+def numpy():
+    # numpy is only imported when the numpy backend is used
+    try:
+        import numpy as np
+    except ImportError:
+        raise InputError('NumPy is required for the numpy backend.')
+
+    return np
+
+
+def record_table(intfile):
+    # a structured array over the intermediate records, laid out like record
+    np = numpy()
+    dtype = np.dtype([
+        ('location', '<u4'), ('lineno', '<u4'), ('columns', '<u2', (3,)),
+        ('format', 'u1'), ('opcode', 'u1'), ('mode', 'u1'),
+        ('label', '<u4'), ('mnemonic', '<u4'), ('symbol', '<u4'), ('value', '<u4'),
+        ('offset', '<u8'), ('length', '<u4')])
+    assert dtype.itemsize == record.size
+
+    return np.frombuffer(intfile.records(), dtype=dtype)
+
+
+def symbol_values(names, symtab):
+    # the value of every interned name by id, -1 for id 0 and undefined symbols
+    np = numpy()
+    values = np.full(len(names)+1, -1, dtype=np.int64)
+    for k, name in enumerate(names, 1):
+        if name in symtab:
+            values[k] = int(symtab[name], 16)
+
+    return values
+
+
+class EncodedRows(object):
+    def __init__(self, fast, failed, no_base, words, sizes, offsets, relocate, data):
+        # rows encoded here; the others are left to the Python encoder
+        self.fast = fast
+        # fast rows with neither a PC nor a BASE relative displacement, and
+        # those of them where no BASE was set
+        self.failed = failed
+        self.no_base = no_base
+        # per row: the instruction word, its size in bytes, where it starts in
+        # data and whether it needs an M record
+        self.words = words
+        self.sizes = sizes
+        self.offsets = offsets
+        self.relocate = relocate
+        # the encoded words packed big-endian, one after the other
+        self.data = data
+
+
+def encode_rows(rows, values, base, base_ids):
+    """Encodes the Format 3/4 rows of a chunk of intermediate records.
+
+    values comes from symbol_values(), base is the BASE value in effect
+    before the chunk (-1 for none) and base_ids are the name ids of BASE and
+    NOBASE. Only the fast rows of the result have words, sizes, etc.
+    """
+    np = numpy()
+    fmt = rows['format']
+    mode = rows['mode']
+    symbol = rows['symbol'].astype(np.int64)
+    value = rows['value'].astype(np.int64)
+    has_operand = rows['length'] > 0
+
+    # the BASE value at each row is set by the last BASE/NOBASE before it,
+    # where BASE only takes a plain symbol
+    base_id, nobase_id = base_ids
+    changes = (rows['mnemonic'] == base_id) | (rows['mnemonic'] == nobase_id)
+    change_values = np.where((rows['mnemonic'] == base_id) & (mode == 0), values[symbol], -1)
+    last = np.maximum.accumulate(np.where(changes, np.arange(len(rows)), -1))
+    bases = np.where(last >= 0, change_values[last], base)
+
+    immediate = (mode & IMMEDIATE) != 0
+    indirect = (mode & INDIRECT) != 0
+    indexed = (mode & INDEXED) != 0
+    digit = immediate & (symbol == 0) & (value != no_value)
+    defined = (symbol > 0) & (values[symbol] >= 0)
+
+    # the rows whose result is known to match the Python encoder: literals,
+    # undefined symbols and out of range numbers are left to it, and so is
+    # Format 4 indirect addressing, which it looks up with the @ included
+    fast = ((fmt == 3) | (fmt == 4)) & ((mode & LITERAL) == 0)
+    fast &= ~has_operand | defined | (digit & ((fmt == 4) | (value <= 4095)))
+    fast &= ~((fmt == 4) & indirect)
+
+    fmt4 = fmt[fast] == 4
+    operand = has_operand[fast]
+    immediate, indirect, indexed, digit = immediate[fast], indirect[fast], indexed[fast], digit[fast]
+
+    n = operand & ~immediate
+    i = operand & ~indirect
+    op = rows['opcode'][fast].astype(np.int64) + 2*n + i
+    flags = indexed * flagTable['x'] + (fmt4 & operand) * flagTable['e']
+    target = np.where(digit, value[fast], np.maximum(values[symbol[fast]], 0))
+    relative = ~fmt4 & operand & ~digit
+
+    bases = bases[fast]
+    words, sizes, failed = encode_words(
+        fmt4, op, flags, target, relative, rows['location'][fast].astype(np.int64), bases)
+
+    # Format 4 symbols are relocated, and so are numbers whose hex digits
+    # include a letter (the Python encoder tells them apart by isdigit())
+    letters = np.zeros(len(target), dtype=bool)
+    for shift in range(0, 32, 4):
+        letters |= ((target >> shift) & 0xF) >= 10
+    relocate = fmt4 & operand & (~digit | letters)
+
+    offsets = np.cumsum(sizes) - sizes
+    data = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for byte in range(4):
+        mask = byte < sizes
+        data[offsets[mask] + byte] = (words[mask] >> (8 * (sizes[mask] - 1 - byte))) & 0xFF
+
+    return EncodedRows(fast, failed, failed & (bases < 0), words, sizes, offsets, relocate, data.tobytes())
+
+
+def encode_words(fmt4, op, flags, target, relative, location, base):
+    # the vectorized encode_format3/encode_format4, with a mask of the rows
+    # where encode_format3 raises an InstructionError
+    np = numpy()
+
+    pc_disp = target - (location + 3)
+    pc_ok = relative & (pc_disp >= -2048) & (pc_disp <= 2047)
+
+    base_disp = target - base
+    need_base = relative & ~pc_ok
+    base_ok = need_base & (base >= 0) & (base_disp >= 0) & (base_disp <= 4095)
+    failed = need_base & ~base_ok
+
+    disp = np.where(pc_ok, pc_disp, np.where(base_ok, base_disp, target)) & 0xFFF
+    flags = flags + pc_ok * flagTable['p'] + base_ok * flagTable['b']
+
+    words = np.where(fmt4,
+                     (op << 24) | (flags << 20) | (target & 0xFFFFF),
+                     (op << 16) | (flags << 12) | disp)
+    sizes = np.where(fmt4, 4, 3)
+
+    return words, sizes, failed
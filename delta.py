@@ -0,0 +1,176 @@
+import sys
+from error import InputError
+
+# bytes of object code per text record
+text_length = 30
+# patch record for bytes the new build no longer loads; C because SIC/XE
+# already uses H, D, R, T, M and E (D and R are its define and refer records)
+clear_record = 'C'
+
+
+class ObjectImage(object):
+    def __init__(self, header, memory, modified, end, deleted=()):
+        self.header = header
+        # relative address -> byte value, for every byte loaded by a T record
+        self.memory = memory
+        self.modified = modified
+        self.end = end
+        # addresses a patch removes from the image, from its C records
+        self.deleted = deleted
+
+    def bounds(self):
+        if not self.memory:
+            return range(0)
+        return range(min(self.memory), max(self.memory)+1)
+
+
+def load_object(path):
+    header, end = None, None
+    memory = {}
+    modified = []
+    deleted = []
+
+    try:
+        with open(path) as f:
+            records = f.read().splitlines()
+    except IOError:
+        raise InputError('Cannot find the object file: {}'.format(path))
+
+    for record in records:
+        if record.startswith('H'):
+            header = record
+        elif record.startswith('T'):
+            addr = int(record[1:7], 16)
+            try:
+                data = bytes.fromhex(record[9:])
+            except ValueError:
+                raise InputError('Invalid text record: {}'.format(record))
+            if len(data) != int(record[7:9], 16):
+                raise InputError('Text record length does not match its object code: {}'.format(record))
+            for i, value in enumerate(data):
+                memory[addr+i] = value
+        elif record.startswith('M'):
+            modified.append(record)
+        elif record.startswith(clear_record):
+            addr = int(record[1:7], 16)
+            deleted.extend(range(addr, addr+int(record[7:9], 16)))
+        elif record.startswith('E'):
+            end = record
+
+    return ObjectImage(header, memory, modified, end, deleted)
+
+
+def modified_bytes(record):
+    addr = int(record[1:7], 16)
+    length = int(record[7:9], 16)
+
+    return range(addr, addr+(length+1)//2)
+
+
+def gen_text(memory, addresses):
+    generated_lines = []
+    temp_line = ''
+    temp_start_addr = None
+    next_addr = None
+
+    for addr in addresses:
+        if addr != next_addr or len(temp_line) == 2*text_length:
+            if temp_line:
+                generated_lines.append(text_record(temp_start_addr, temp_line))
+            temp_line = ''
+            temp_start_addr = addr
+
+        temp_line += format(memory[addr], '02X')
+        next_addr = addr + 1
+
+    if temp_line:
+        generated_lines.append(text_record(temp_start_addr, temp_line))
+
+    return generated_lines
+
+
+def text_record(addr, data):
+    return 'T{}{}{}'.format(format(addr, '06X'), format(len(data)//2, '02X'), data)
+
+
+def gen_deleted(addresses):
+    generated_lines = []
+    temp_start_addr = None
+    temp_length = 0
+
+    for addr in addresses:
+        if temp_length and (addr != temp_start_addr + temp_length or temp_length == 0xFF):
+            generated_lines.append('{}{}{}'.format(clear_record, format(temp_start_addr, '06X'), format(temp_length, '02X')))
+            temp_length = 0
+        if temp_length == 0:
+            temp_start_addr = addr
+        temp_length += 1
+
+    if temp_length:
+        generated_lines.append('{}{}{}'.format(clear_record, format(temp_start_addr, '06X'), format(temp_length, '02X')))
+
+    return generated_lines
+
+
+def diff(previous, current):
+    changed = set(x for x in current.bounds()
+                  if x in current.memory and current.memory[x] != previous.memory.get(x))
+
+    # bytes whose relocation changed are patched along with their M records
+    for record in set(previous.modified) ^ set(current.modified):
+        changed.update(x for x in modified_bytes(record) if x in current.memory)
+
+    addresses = [x for x in current.bounds() if x in changed]
+    memory = dict((x, current.memory[x]) for x in addresses)
+    modified = [r for r in current.modified if any(x in changed for x in modified_bytes(r))]
+    # bytes the new build no longer loads, inside its bounds or outside them
+    deleted = [x for x in previous.bounds() if x in previous.memory and x not in current.memory]
+
+    return ObjectImage(current.header, memory, modified, current.end, deleted)
+
+
+def apply_patch(image, patch):
+    memory = dict(image.memory)
+    memory.update(patch.memory)
+    for addr in patch.deleted:
+        memory.pop(addr, None)
+
+    deleted = set(patch.deleted)
+    modified = [r for r in image.modified
+                if not any(x in patch.memory or x in deleted for x in modified_bytes(r))]
+    modified = sorted(modified + patch.modified, key=lambda r: int(r[1:7], 16))
+
+    return ObjectImage(patch.header or image.header, memory, modified, patch.end or image.end)
+
+
+def write_object(path, image):
+    addresses = [x for x in image.bounds() if x in image.memory]
+
+    with open(path, 'w') as f:
+        f.write(image.header + '\n')
+        text = gen_text(image.memory, addresses)
+        if text:
+            f.write('\n'.join(text) + '\n')
+        if image.deleted:
+            f.write('\n'.join(gen_deleted(image.deleted)) + '\n')
+        if image.modified:
+            f.write('\n'.join(image.modified) + '\n')
+        f.write(image.end)
+
+
+def generate_delta(filename, previous):
+    patch = diff(previous, load_object(filename+'.obj'))
+    write_object(filename+'.patch', patch)
+
+    return patch
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4):
+        raise InputError(
+            "\nInput Error! Input example:\n" +
+            "IMAGE.OBJ PATCH.PATCH [OUTPUT.OBJ]")
+
+    output = sys.argv[3] if len(sys.argv) == 4 else sys.argv[1]
+    image = apply_patch(load_object(sys.argv[1]), load_object(sys.argv[2]))
+    write_object(output, image)
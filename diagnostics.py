@@ -0,0 +1,50 @@
+import json
+from error import DuplicateSymbolError, OpcodeLookupError, ErrorLimitError
+
+# source field an error points at, by error type; the operand otherwise
+fields = {
+    DuplicateSymbolError: 0,
+    OpcodeLookupError: 1
+}
+
+
+class Diagnostics(object):
+    def __init__(self, limit=100):
+        self._limit = limit
+        self._errors = []
+        self._truncated = False
+
+    @property
+    def errors(self):
+        return self._errors
+
+    def record(self, error, line=None):
+        # the limit is only reached when one more error than it allows comes in
+        if len(self._errors) == self._limit:
+            self._truncated = True
+            raise ErrorLimitError('Too many errors, stopped after {}.'.format(self._limit))
+
+        if line is not None:
+            error.line = line.lineno
+            field = fields.get(type(error), 2)
+            error.column = line.columns[field] or line.columns[1]
+
+        self._errors.append({
+            'type': type(error).__name__,
+            'message': str(error),
+            'line': error.line,
+            'column': error.column
+        })
+        print('{}:{}: {}: {}'.format(error.line, error.column, type(error).__name__, error))
+
+    def output(self, filename):
+        print('{} error(s) found{}.'.format(
+            len(self._errors), ', stopped early' if self._truncated else ''))
+
+        self._errors.sort(key=lambda x: (x['line'] or 0, x['column'] or 0))
+        with open(filename+'.err.json', 'w') as f:
+            json.dump({
+                'errors': self._errors,
+                'count': len(self._errors),
+                'truncated': self._truncated
+            }, f, indent=2)
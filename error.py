@@ -1,5 +1,7 @@
 class Error(Exception):
-    pass
+    # source position, filled in when the error is reported
+    line = None
+    column = None
 
 
 class LineFieldsError(Error):
@@ -24,3 +26,7 @@ class InstructionError(Error):
 
 class InputError(Error):
     pass
+
+
+class ErrorLimitError(Error):
+    pass
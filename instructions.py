@@ -1,11 +1,15 @@
-from error import LineFieldsError, InstructionError, UndefinedSymbolError
+from types import MappingProxyType
+from error import LineFieldsError, InstructionError, UndefinedSymbolError, InputError
+from isa import load_isa, default_path
 
 
 class Instr(object):
-    def __init__(self, opcode, format, operands):
+    __slots__ = ('_opcode', '_format', '_shape')
+
+    def __init__(self, opcode, format, shape):
         self._opcode = opcode
         self._format = format
-        self._operands = operands
+        self._shape = shape
 
     @property
     def opcode(self):
@@ -16,91 +20,36 @@ class Instr(object):
         return self._format
 
     @property
-    def operands(self):
-        return self._operands
-
-
-OpTable = {
-    'ADD':     Instr('18', 3, ['m']),
-    'ADDF':    Instr('58', 3, ['m']),
-    'ADDR':    Instr('90', 2, ['r1', 'r2']),
-    'AND':     Instr('40', 3, ['m']),
-    'CLEAR':   Instr('B4', 2, ['r1']),
-    'COMP':    Instr('28', 3, ['m']),
-    'COMPF':   Instr('88', 3, ['m']),
-    'COMPR':   Instr('A0', 2, ['r1', 'r2']),
-    'DIV':     Instr('24', 3, ['m']),
-    'DIVF':    Instr('64', 3, ['m']),
-    'DIVR':    Instr('9C', 2, ['r1', 'r2']),
-    'FIX':     Instr('C4', 1, None),
-    'FLOAT':   Instr('C0', 1, None),
-    'HIO':     Instr('F4', 1, None),
-    'J':       Instr('3C', 3, ['m']),
-    'JEQ':     Instr('30', 3, ['m']),
-    'JGT':     Instr('34', 3, ['m']),
-    'JLT':     Instr('38', 3, ['m']),
-    'JSUB':    Instr('48', 3, ['m']),
-    'LDA':     Instr('00', 3, ['m']),
-    'LDB':     Instr('68', 3, ['m']),
-    'LDCH':    Instr('50', 3, ['m']),
-    'LDF':     Instr('70', 3, ['m']),
-    'LDL':     Instr('08', 3, ['m']),
-    'LDS':     Instr('6C', 3, ['m']),
-    'LDT':     Instr('74', 3, ['m']),
-    'LDX':     Instr('04', 3, ['m']),
-    'LPS':     Instr('D0', 3, ['m']),
-    'MULF':    Instr('60', 3, ['m']),
-    'MULR':    Instr('98', 2, ['r1', 'r2']),
-    'NORM':    Instr('C8', 1, None),
-    'OR':      Instr('44', 3, ['m']),
-    'RD':      Instr('D8', 3, ['m']),
-    'RMO':     Instr('AC', 2, ['r1', 'r2']),
-    'RSUB':    Instr('4C', 3, None),
-    'SHIFTL':  Instr('A4', 2, ['r1', 'n']),
-    'SHIFTR':  Instr('A8', 2, ['r1', 'n']),
-    'SIO':     Instr('F0', 1, None),
-    'SSK':     Instr('EC', 3, ['m']),
-    'STA':     Instr('0C', 3, ['m']),
-    'STB':     Instr('78', 3, ['m']),
-    'STCH':    Instr('54', 3, ['m']),
-    'STF':     Instr('80', 3, ['m']),
-    'STI':     Instr('D4', 3, ['m']),
-    'STL':     Instr('14', 3, ['m']),
-    'STS':     Instr('7C', 3, ['m']),
-    'STSW':    Instr('E8', 3, ['m']),
-    'STT':     Instr('84', 3, ['m']),
-    'STX':     Instr('10', 3, ['m']),
-    'SUB':     Instr('1C', 3, ['m']),
-    'SUBF':    Instr('5C', 3, ['m']),
-    'SUBR':    Instr('94', 2, ['r1', 'r2']),
-    'SVC':     Instr('B0', 2, ['n']),
-    'TD':      Instr('E0', 3, ['m']),
-    'TIO':     Instr('F8', 1, None),
-    'TIX':     Instr('2C', 3, ['m']),
-    'TIXR':    Instr('B8', 2, ['r1']),
-    'WD':      Instr('DC', 3, ['m'])
-}
-
-flagTable = {
-    'n': 0b100000,
-    'i': 0b010000,
-    'x': 0b001000,
-    'b': 0b000100,
-    'p': 0b000010,
-    'e': 0b000001
-}
-
-registerTable = {
-    'A':  0,
-    'X':  1,
-    'L':  2,
-    'B':  3,
-    'S':  4,
-    'T':  5,
-    'F':  6,
-    'PC': 8,
-    'SW': 9
-}
+    def shape(self):
+        return self._shape
+
+
+# filled in by select_isa(), read-only for everyone else
+_optable = {}
+_decode = {}
+_flags = {}
+_registers = {}
+
+OpTable = MappingProxyType(_optable)
+DecodeTable = MappingProxyType(_decode)
+flagTable = MappingProxyType(_flags)
+registerTable = MappingProxyType(_registers)
+
+
+def select_isa(name, path=default_path):
+    variants = load_isa(path)
+    if name not in variants:
+        raise InputError('Unknown instruction set: {}'.format(name))
+    instructions, registers, flags = variants[name]
+
+    _optable.clear()
+    _optable.update((k, Instr(*v)) for k, v in instructions.items())
+    _decode.clear()
+    _decode.update((v[0], k) for k, v in instructions.items())
+    _flags.clear()
+    _flags.update(flags)
+    _registers.clear()
+    _registers.update(registers)
 
 
 class Format(object):
@@ -116,7 +65,7 @@ class Format1(Format):
         if self._mnemonic is None:
             raise LineFieldsError('A mnemonic was not specified.')
 
-        output = OpTable[self._mnemonic].opcode
+        output = format(OpTable[self._mnemonic].opcode, '02X')
 
         return self._mnemonic, None, output
 
@@ -133,7 +82,7 @@ class Format2(Format):
 
         output = ''
 
-        output += OpTable[self._mnemonic].opcode
+        output += format(OpTable[self._mnemonic].opcode, '02X')
 
         r1_lookup = registerTable[self._r1]
         r1_lookup = str(hex(r1_lookup)).lstrip('0x') or 0
@@ -159,8 +108,9 @@ class Format3(Format):
         self._disp = None
         self._flags, self._n, self._i = check_flags(line)
         self._contents = line
+        self._output = None
 
-    def generate(self):
+    def resolve(self):
         if self._mnemonic is None:
             raise LineFieldsError('A mnemonic was not specified.')
 
@@ -195,41 +145,24 @@ class Format3(Format):
         else:
             self._disp = 0
 
-        if not is_digit and has_operand:
-            pc = int(self._location) + 3
-            disp = int(str(self._disp), 16) - pc
-
-            if -2048 <= disp <= 2047:
-                self._flags += flagTable['p']
-                disp = twos_complement(disp, 12)
-            else:
-                if self._base is None:
-                    raise InstructionError('BASE directive has not been not set.')
-                base = int(str(self._base), 16)
-                disp = int(str(self._disp), 16) - base
-
-                if disp < 0 or disp > 4095:
-                    raise InstructionError('Neither PC relative or Base relative could be used.')
-                self._flags += flagTable['b']
-                disp = to_binary(disp).zfill(12)
+        op = OpTable[self._mnemonic].opcode + 2*self._n + self._i
+        base = None if self._base is None else int(str(self._base), 16)
 
+        if not is_digit and has_operand:
+            return op, self._flags, int(str(self._disp), 16), True, self._location, base
         else:
-            disp = twos_complement(int(self._disp), 12)
+            if int(self._disp) > 4095:
+                raise InstructionError('Immediate value out of range: {}'.format(self._disp))
+            return op, self._flags, int(self._disp), False, self._location, base
 
-        op = int(OpTable[self._mnemonic].opcode, 16)
-        if self._n:
-            op += 2
-        if self._i:
-            op += 1
-        op = twos_complement(op, 6)
+    def generate(self):
+        if self._output is None:
+            self.preset(format(encode_format3(*self.resolve()), '06X'))
 
-        output = ''
-        output += op
-        output += to_binary(hex(self._flags)).zfill(4)
-        output += disp
-        hex_output = hex(int(output, 2))[2:].zfill(6).upper()
+        return self._output
 
-        return self._mnemonic, self._disp, hex_output
+    def preset(self, output):
+        self._output = self._mnemonic, self._disp, output
 
 
 class Format4(Format):
@@ -240,8 +173,9 @@ class Format4(Format):
         self._operand = line.operand
         self._flags, self._n, self._i = check_flags(line)
         self._contents = line
+        self._output = None
 
-    def generate(self):
+    def resolve(self):
         if self._mnemonic is None:
             raise LineFieldsError('A mnemonic was not specified.')
 
@@ -265,21 +199,18 @@ class Format4(Format):
         else:
             self._disp = 0
 
-        op = int(str(OpTable[self._mnemonic].opcode), 16)
-        if self._n:
-            op += 2
-        if self._i:
-            op += 1
-        op = twos_complement(op, 6)
+        op = OpTable[self._mnemonic].opcode + 2*self._n + self._i
 
-        output = ''
-        output += op
-        output += to_binary(hex(self._flags)).zfill(4)
-        output += twos_complement(int(self._disp, 16), 20)
+        return op, self._flags, int(str(self._disp), 16)
 
-        hex_output = hex(int(output, 2))[2:].zfill(6).upper()
+    def generate(self):
+        if self._output is None:
+            self.preset(format(encode_format4(*self.resolve()), '08X'))
+
+        return self._output
 
-        return self._mnemonic, self._disp, hex_output
+    def preset(self, output):
+        self._output = self._mnemonic, self._disp, output
 
     def relocate(self):
         relocate = False
@@ -300,8 +231,36 @@ class Format4(Format):
         return relocate
 
 
+def encode_format3(op, flags, target, relative, location, base):
+    if relative:
+        disp = target - (location + 3)
+
+        if -2048 <= disp <= 2047:
+            flags += flagTable['p']
+        else:
+            if base is None:
+                raise InstructionError('BASE directive has not been not set.')
+            disp = target - base
+
+            if disp < 0 or disp > 4095:
+                raise InstructionError('Neither PC relative or Base relative could be used.')
+            flags += flagTable['b']
+    else:
+        disp = target
+
+    return (op << 16) | (flags << 12) | (disp & 0xFFF)
+
+
+def encode_format4(op, flags, target):
+    return (op << 24) | (flags << 20) | (target & 0xFFFFF)
+
+
 def sic_format(symtab, mnemonic, operand):
-    op = OpTable[mnemonic].opcode
+    op = format(OpTable[mnemonic].opcode, '02X')
+
+    symbol = operand[0] if indexed(operand) else operand
+    if operand is not None and symbol not in symtab:
+        raise UndefinedSymbolError('Undefined symbol: {}'.format(symbol))
 
     if operand is None:
         TA = str(0).zfill(4)
@@ -334,18 +293,6 @@ def extended(x): return str(x).startswith('+')
 def literal(x): return str(x).startswith('=')
 
 
-def to_binary(hex_string):
-    return bin(int(str(hex_string), 16))[2:]
-
-
-def twos_complement(value, bits):
-    if value < 0:
-        value = (1 << bits) + value
-    out_format = '{:0%ib}' % bits
-
-    return out_format.format(value)
-
-
 def check_flags(line):
     flags = 0
     n = False
@@ -364,7 +311,7 @@ def check_flags(line):
     if indexed(line.operand):
         if not n or not i:
             raise LineFieldsError(
-                message="Indexed addressing cannot be used with"
+                "Indexed addressing cannot be used with"
                 + " immediate or indirect addressing modes.")
         else:
             flags += flagTable['x']
@@ -0,0 +1,146 @@
+import mmap
+import struct
+import tempfile
+from instructions import OpTable, indexed, immediate, indirect, extended, literal
+from xref import referenced_symbol
+
+# location, line number, label/mnemonic/operand columns, format (0 for
+# directives), opcode, addressing mode, label/mnemonic/referenced symbol ids
+# (0 for none), immediate value and the offset and length of the operand text
+# in the heap. Pass 2 only reads the classification with the numpy backend.
+record = struct.Struct('<II3HBBBIIIIQI')
+no_location = 0xFFFFFFFF
+no_value = 0xFFFFFFFF
+
+# addressing mode bits
+IMMEDIATE, INDIRECT, INDEXED, LITERAL = 1, 2, 4, 8
+
+
+class IntermediateFile(object):
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        # operand text, which can be of any length
+        self._heap = tempfile.TemporaryFile()
+        self._heap_size = 0
+        # labels, mnemonics and referenced symbols by id
+        self._names = []
+        self._ids = {}
+        self._maps = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _name_id(self, name):
+        if name is None:
+            return 0
+        if name not in self._ids:
+            self._names.append(name)
+            self._ids[name] = len(self._names)
+
+        return self._ids[name]
+
+    @property
+    def names(self):
+        return self._names
+
+    def write(self, line):
+        location = no_location if line.location is None else line.location
+        instr_format, opcode = classify(line.mnemonic)
+
+        if isinstance(line.operand, list):
+            operand = ','.join(line.operand)
+        else:
+            operand = line.operand
+
+        if operand is None:
+            offset, length = 0, 0
+        else:
+            data = operand.encode('utf-8')
+            offset, length = self._heap_size, len(data)
+            self._heap.write(data)
+            self._heap_size += length
+
+        lineno = line.lineno or 0
+        columns = [x or 0 for x in line.columns]
+        self._file.write(record.pack(
+            location, lineno, columns[0], columns[1], columns[2],
+            instr_format, opcode, addressing_mode(line.operand),
+            self._name_id(line.label), self._name_id(line.mnemonic),
+            self._name_id(referenced_symbol(line.operand)), immediate_value(line.operand),
+            offset, length))
+
+    def records(self):
+        # the packed records, mapped read-only
+        if self._maps is None:
+            self._file.flush()
+            self._heap.flush()
+            if self._file.tell() == 0:
+                return b''
+            self._maps = [mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)]
+            if self._heap_size:
+                self._maps.append(mmap.mmap(self._heap.fileno(), 0, access=mmap.ACCESS_READ))
+
+        return self._maps[0]
+
+    def __iter__(self):
+        records = self.records()
+        if not records:
+            return
+        heap = self._maps[-1]
+        for offset in range(0, len(records), record.size):
+            fields = record.unpack_from(records, offset)
+            location, lineno, columns = fields[0], fields[1], fields[2:5]
+            label, mnemonic = [self._names[x-1] if x else None for x in fields[8:10]]
+            text_offset, length = fields[12:14]
+            location = None if location == no_location else location
+
+            if length:
+                operand = heap[text_offset:text_offset+length].decode('utf-8')
+                if ',' in operand:
+                    operand = operand.split(',')
+            else:
+                operand = None
+
+            yield (location, label, mnemonic, operand,
+                   lineno or None, tuple(x or None for x in columns))
+
+    def close(self):
+        for m in self._maps or []:
+            m.close()
+        self._maps = None
+        self._file.close()
+        self._heap.close()
+
+
+def classify(mnemonic):
+    instr = OpTable.get(mnemonic[1:] if extended(mnemonic) else mnemonic)
+    # only Format 3 instructions can be extended to Format 4
+    if instr is None or (extended(mnemonic) and instr.format != 3):
+        return 0, 0
+
+    return instr.format + extended(mnemonic), instr.opcode
+
+
+def addressing_mode(operand):
+    mode = 0
+    if immediate(operand):
+        mode |= IMMEDIATE
+    if indirect(operand):
+        mode |= INDIRECT
+    if indexed(operand):
+        mode |= INDEXED
+    if literal(operand):
+        mode |= LITERAL
+
+    return mode
+
+
+def immediate_value(operand):
+    # the number of a #n operand, when it fits in the record
+    if not immediate(operand) or not operand[1:].isdigit() or int(operand[1:]) >= no_value:
+        return no_value
+
+    return int(operand[1:])
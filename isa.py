@@ -0,0 +1,92 @@
+import os
+import json
+import marshal
+from error import InputError
+
+# isa.json maps each instruction set name to its registers, nixbpe flags and
+# instructions ("MNEMONIC": [hex opcode, format, operand shape]). A set can
+# "extends" another one and only list what it adds or overrides.
+
+# operand shapes
+NO_OPERAND, MEMORY, REGISTER, REGISTERS, REGISTER_NUMBER, NUMBER = range(6)
+shapes = {
+    '':      NO_OPERAND,
+    'm':     MEMORY,
+    'r1':    REGISTER,
+    'r1,r2': REGISTERS,
+    'r1,n':  REGISTER_NUMBER,
+    'n':     NUMBER
+}
+operand_count = (0, 1, 1, 2, 2, 1)
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'isa.json')
+cache_version = 2
+
+
+def compile_isa(data):
+    compiled = {}
+
+    def resolve(name, seen):
+        if name in compiled:
+            return compiled[name]
+        if name not in data:
+            raise InputError('Unknown instruction set: {}'.format(name))
+        if name in seen:
+            raise InputError('Instruction set extends itself: {}'.format(name))
+
+        variant = data[name]
+        if 'extends' in variant:
+            parent = resolve(variant['extends'], seen + [name])
+            instructions, registers, flags = [dict(x) for x in parent]
+        else:
+            instructions, registers, flags = {}, {}, {}
+
+        for mnemonic, (opcode, format, shape) in variant.get('instructions', {}).items():
+            if shape not in shapes:
+                raise InputError('Invalid operand shape for {}: {}'.format(mnemonic, shape))
+            instructions[mnemonic] = (int(opcode, 16), format, shapes[shape])
+        registers.update(variant.get('registers', {}))
+        flags.update(variant.get('flags', {}))
+
+        compiled[name] = (instructions, registers, flags)
+        return compiled[name]
+
+    for name in data:
+        resolve(name, [])
+
+    return compiled
+
+
+def cache_path(path):
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, '__pycache__', basename + '.marshal')
+
+
+def load_isa(path=default_path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise InputError('Cannot find the instruction set file: {}'.format(path))
+    key = (cache_version, stat.st_mtime_ns, stat.st_size)
+
+    # the cache only holds dicts, tuples, strings and ints, which marshal
+    # loads without running any code, like the .pyc files next to it
+    try:
+        with open(cache_path(path), 'rb') as f:
+            cached_key, compiled = marshal.loads(f.read())
+        if cached_key == key:
+            return compiled
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(path) as f:
+        compiled = compile_isa(json.load(f))
+
+    try:
+        os.makedirs(os.path.dirname(cache_path(path)), exist_ok=True)
+        with open(cache_path(path), 'wb') as f:
+            marshal.dump((key, compiled), f)
+    except OSError:
+        pass
+
+    return compiled
@@ -1,41 +1,66 @@
+import os
+import shutil
+import tempfile
 from instructions import Format, Format4
 
 directives = ['START', 'END', 'RESB', 'RESW', 'BASE']
 
 
-def outputLST(filename, start_addr, asmlines, obj_code, mode):
-    with open(filename+'.lst', 'w') as f:
-        count = 0
-        for line in asmlines:
-            loc = line.location if line.location else start_addr
-            loc = '' if line.mnemonic == 'END' else format(loc, 'x').zfill(4).upper()
-            label = '' if line.label is None else line.label
-            mnemonic = line.mnemonic
-
-            if line.operand is None:
-                operand = ''
-            elif isinstance(line.operand, str):
-                operand = line.operand
-            else:
-                operand = ','.join(line.operand)
-
-            if mnemonic in directives:
-                obj = ''
-            else:
-                obj = obj_code[count][1]
-                count += 1
-
-                if mode == 'sicxe':
-                    if isinstance(obj, tuple):
-                        obj = obj[-1]
-                    else:
-                        obj = obj.generate()[2]
-                else:
-                    if isinstance(obj, tuple):
-                        obj = obj[-1]
-
-            print(loc.ljust(10), label.ljust(10), mnemonic.ljust(10), operand.ljust(10), obj.ljust(10))
-            f.write('{0}{1}{2}{3}{4}\n'.format(loc.ljust(10), label.ljust(10), mnemonic.ljust(10), operand.ljust(10), obj.ljust(8)))
+class ListingWriter(object):
+    def __init__(self, filename, start_addr, mode):
+        self._path = filename+'.lst'
+        self._file = open(self._path, 'w')
+        self._start_addr = start_addr
+        self._mode = mode
+
+    def add(self, line, obj):
+        loc = line.location if line.location else self._start_addr
+        loc = '' if line.mnemonic == 'END' else format(loc, 'x').zfill(4).upper()
+        label = '' if line.label is None else line.label
+        mnemonic = line.mnemonic
+
+        if line.operand is None:
+            operand = ''
+        elif isinstance(line.operand, str):
+            operand = line.operand
+        else:
+            operand = ','.join(line.operand)
+
+        if obj is None:
+            obj = ''
+        elif isinstance(obj, tuple):
+            obj = obj[-1]
+        elif self._mode == 'sicxe':
+            obj = obj.generate()[2]
+
+        print(loc.ljust(10), label.ljust(10), mnemonic.ljust(10), operand.ljust(10), obj.ljust(10))
+        self._file.write('{0}{1}{2}{3}{4}\n'.format(loc.ljust(10), label.ljust(10), mnemonic.ljust(10), operand.ljust(10), obj.ljust(8)))
+
+    def close(self, xref=None):
+        if xref:
+            print()
+            self._file.write('\n')
+            for line in xref:
+                print(line)
+                self._file.write(line + '\n')
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+        os.remove(self._path)
+
+
+def outputLST(filename, start_addr, asmlines, obj_code, mode, xref=None):
+    listing = ListingWriter(filename, start_addr, mode)
+    count = 0
+    for line in asmlines:
+        if line.mnemonic in directives:
+            obj = None
+        else:
+            obj = obj_code[count][1]
+            count += 1
+        listing.add(line, obj)
+    listing.close(xref)
 
 
 def gen_header(program_name, start_addr, program_length):
@@ -43,86 +68,100 @@ def gen_header(program_name, start_addr, program_length):
     return 'H{0}{1}{2}'.format(program_name.ljust(6), start_addr, program_length)
 
 
-def gen_text_sicxe(generated_code, start_addr):
-    code = list(generated_code)
-    generated_lines = []
-    modified = []
-    length = 60
-
-    next_addr = code[0][0]
-    temp_length = 0
-
-    while len(code) > 0:
-        temp_line = ''
-        temp_start_addr = next_addr
-        while(len(temp_line) <= length):
-            x = code.pop(0)
-            if isinstance(x[1], Format):
-                temp = x[1].generate()[2].upper()
-            else:
-                temp = x[1][2].upper()
-
-            temp_line += temp
-
-            if isinstance(x[1], Format4):
-                if x[1].relocate():
-                    relative_addr = hex(x[0] - start_addr + 1)[2:].zfill(6).upper()
-                    relocate_length = '05'
-                    modified.append('M{}{}'.format(relative_addr, relocate_length))
-
-            if len(code) == 0:
-                break
-
-        if len(code) == 0:
-            temp_length = hex(x[0] - temp_start_addr)[2:].zfill(2).upper()
+class ObjectWriter(object):
+    # T and M records are spooled to temporary files until the program length is known
+    def __init__(self, filename, program_name, start_addr, mode):
+        self._path = filename+'.obj'
+        self._program_name = program_name
+        self._start_addr = start_addr
+        self._mode = mode
+        self._text = tempfile.TemporaryFile('w+')
+        self._modified = tempfile.TemporaryFile('w+')
+        self._temp_line = None
+        self._temp_length = 0
+        self._temp_start_addr = None
+        self._next_addr = None
+        self._last_addr = None
+        # packed object code not yet written into the text record: a bytes
+        # object and the slice of it that belongs to the record
+        self._data = None
+        self._data_start = 0
+        self._data_end = 0
+
+    def add(self, addr, obj):
+        if self._mode == 'sic':
+            temp = obj[-1] if isinstance(obj, tuple) else obj.upper()
+        elif isinstance(obj, Format):
+            temp = obj.generate()[2].upper()
         else:
-            next_addr = code[0][0]
-            temp_length = hex(next_addr - temp_start_addr)[2:].zfill(2).upper()
-        temp_start_addr = hex(temp_start_addr - start_addr)[2:].zfill(6).upper()
-        output = 'T{}{}{}'.format(temp_start_addr, temp_length, temp_line)
+            temp = obj[2].upper()
 
-        generated_lines.append(output)
-        temp_length = 0
+        self._reserve(addr, len(temp))
+        self._add_data()
+        self._temp_line += temp
 
-    return generated_lines, modified
+        if self._mode == 'sicxe' and isinstance(obj, Format4) and obj.relocate():
+            self._add_modification(addr)
 
-
-def gen_text_sic(object_code, symtab, start_addr):
-    generated_lines = []
-    code = list(object_code)
-    length = 60
-
-    next_addr = object_code[0][0]
-    temp_length = 0
-
-    while len(code) > 0:
-        temp_line = ''
-        temp_start_addr = next_addr
-        while(len(temp_line) <= length):
-            x = code.pop(0)
-
-            if isinstance(x[1], tuple):
-                temp = x[1][-1]
-            else:
-                temp = x[1].upper()
-
-            temp_line += temp
-
-            if len(code) == 0:
-                break
-
-        if len(code) == 0:
-            temp_length = hex(x[0] - temp_start_addr)[2:].zfill(2).upper()
+    def add_data(self, addr, data, start, end, relocate=False):
+        # object code already packed into data[start:end]; consecutive slices
+        # of the same buffer are turned into hex once per text record
+        self._reserve(addr, 2*(end-start))
+        if self._data is data and self._data_end == start:
+            self._data_end = end
         else:
-            next_addr = code[0][0]
-            temp_length = hex(next_addr - temp_start_addr)[2:].zfill(2).upper()
-        temp_start_addr = hex(temp_start_addr - start_addr)[2:].zfill(6).upper()
-        output = 'T{}{}{}'.format(temp_start_addr, temp_length, temp_line)
-
-        generated_lines.append(output)
-        temp_length = 0
+            self._add_data()
+            self._data, self._data_start, self._data_end = data, start, end
 
-    return generated_lines, None
+        if relocate:
+            self._add_modification(addr)
+
+    def _reserve(self, addr, length):
+        # a text record holds at most 60 half-bytes of consecutive addresses,
+        # so a gap left by RESB/RESW starts a new one
+        if self._temp_line is not None and (
+                addr != self._next_addr or self._temp_length + length > 60):
+            self._write_text()
+        if self._temp_line is None:
+            self._temp_line = ''
+            self._temp_length = 0
+            self._temp_start_addr = addr
+        self._temp_length += length
+        self._next_addr = addr + length//2
+        self._last_addr = addr
+
+    def _add_data(self):
+        if self._data is not None:
+            self._temp_line += self._data[self._data_start:self._data_end].hex().upper()
+            self._data = None
+
+    def _add_modification(self, addr):
+        relative_addr = hex(addr - self._start_addr + 1)[2:].zfill(6).upper()
+        relocate_length = '05'
+        self._modified.write('M{}{}\n'.format(relative_addr, relocate_length))
+
+    def _write_text(self):
+        self._add_data()
+        temp_length = hex(self._temp_length//2)[2:].zfill(2).upper()
+        temp_start_addr = hex(self._temp_start_addr - self._start_addr)[2:].zfill(6).upper()
+        self._text.write('T{}{}{}\n'.format(temp_start_addr, temp_length, self._temp_line))
+        self._temp_line = None
+
+    def close(self):
+        self._write_text()
+        program_length = hex(self._last_addr - self._start_addr + 1)[2:].zfill(6).upper()
+
+        with open(self._path, 'w') as f:
+            f.write(gen_header(self._program_name, self._start_addr, program_length) + '\n')
+            for spool in (self._text, self._modified):
+                spool.seek(0)
+                shutil.copyfileobj(spool, f)
+            f.write(gen_end(self._start_addr))
+        self.discard()
+
+    def discard(self):
+        self._text.close()
+        self._modified.close()
 
 
 def gen_end(start_addr):
@@ -130,17 +169,7 @@ def gen_end(start_addr):
 
 
 def generate_records(filename, program_name, start_addr, object_code, symtab, mode):
-    program_length = hex(object_code[-1][0] - start_addr + 1)[2:].zfill(6).upper()
-    head = gen_header(program_name, start_addr, program_length)
-    if mode == 'sic':
-        text, relocate = gen_text_sic(object_code, symtab, start_addr)
-    else:
-        text, relocate = gen_text_sicxe(object_code, start_addr)
-    end = gen_end(start_addr)
-
-    with open(filename+'.obj', 'w') as f:
-        f.write(head + '\n')
-        f.write('\n'.join(text) + '\n')
-        if relocate:
-            f.write('\n'.join(relocate) + '\n')
-        f.write(end)
+    records = ObjectWriter(filename, program_name, start_addr, mode)
+    for addr, obj in object_code:
+        records.add(addr, obj)
+    records.close()
@@ -0,0 +1,149 @@
+import os
+import random
+import shutil
+import subprocess
+import sys
+import pytest
+
+pytest.importorskip('numpy')
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# FIRST: out of PC range with no BASE set; STA: out of BASE range;
+# LDA MID: out of PC range but BASE relative
+base_fallback = '''BASES\tSTART\t0
+FIRST\tLDA\tFAR
+\tBASE\tFIRST
+\tSTA\tFAR
+\tLDA\tMID
+\t+JSUB\tFAR
+BUF\tRESB\t2990
+MID\tWORD\t1
+BUF2\tRESB\t3000
+FAR\tWORD\t1
+\tEND\tFIRST
+'''
+
+# lines the numpy backend leaves to the Python encoder, between ones it encodes
+fallback_rows = '''ROWS\tSTART\t0
+FIRST\t+LDA\t@FAR
+\tLDA\t=X'05'
+\tLDA\t#4096
+\tLDA\tNOPE
+\t+LDA\t#4000
+\t+LDA\t#256
+\tCLEAR\tA
+\tRSUB
+\t+JSUB\tFAR
+FAR\tWORD\t1
+\tEND\tFIRST
+'''
+
+
+def generated_program(blocks=20, size=60):
+    rng = random.Random(2024)
+    ops = ['LDA', 'STA', 'LDX', 'COMP', 'JEQ', 'STL', 'ADD', 'TIX', 'LDCH', 'STCH']
+    lines = ['GEN\tSTART\t1000']
+
+    for b in range(blocks):
+        lines.append('B{}\tLDB\t#B{}'.format(b, b))
+        lines.append('\tBASE\tB{}'.format(b))
+        lines.append('BUF{}\tRESB\t{}'.format(b, rng.randint(2100, 4000)))
+        for k in range(size):
+            near = 'L{}_{}'.format(b, min(size-1, max(0, k + rng.randint(-20, 20))))
+            far = 'L{}_{}'.format(rng.randrange(blocks), rng.randrange(size))
+            operand = rng.choice([near, '#' + near, '@' + near, near + ',X',
+                                  'B{}'.format(b), '#{}'.format(rng.randint(0, 4095))])
+            if rng.random() < 0.15:
+                lines.append('L{}_{}\t+{}\t{}'.format(b, k, rng.choice(ops), rng.choice([far, '#' + far])))
+            else:
+                lines.append('L{}_{}\t{}\t{}'.format(b, k, rng.choice(ops), operand))
+    lines.append('\tEND\tGEN')
+
+    return '\n'.join(lines) + '\n'
+
+
+def assemble(tmp_path, name, source, backend, *options):
+    workdir = tmp_path / backend
+    workdir.mkdir(exist_ok=True)
+    (workdir / (name + '.asm')).write_text(source)
+
+    result = subprocess.run(
+        [sys.executable, os.path.join(here, 'assembler.py'), name + '.asm', '-sicxe',
+         '-backend=' + backend] + list(options),
+        cwd=str(workdir), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    outputs = {}
+    for ext in ('.obj', '.lst', '.err.json'):
+        path = workdir / (name + ext)
+        if path.exists():
+            outputs[ext] = path.read_text()
+
+    return result.returncode, outputs
+
+
+def assert_same_output(tmp_path, name, source, *options):
+    python = assemble(tmp_path, name, source, 'python', *options)
+    numpy = assemble(tmp_path, name, source, 'numpy', *options)
+    assert python == numpy
+
+    return python
+
+
+def test_fig25(tmp_path):
+    with open(os.path.join(here, 'fig2.5.asm')) as f:
+        source = f.read()
+
+    returncode, outputs = assert_same_output(tmp_path, 'fig2.5', source)
+    assert returncode == 0
+    assert set(outputs) == {'.obj', '.lst'}
+
+
+def test_generated_program(tmp_path):
+    returncode, outputs = assert_same_output(tmp_path, 'gen', generated_program())
+    assert returncode == 0
+    # some Format 3 instructions were encoded BASE relative (b bit set, p bit clear)
+    listing = outputs['.lst'].split('\nXREF')[0]
+    codes = [line[40:].strip() for line in listing.splitlines()]
+    assert any(int(x[2], 16) & 0b0110 == 0b0100 for x in codes if len(x) == 6)
+
+
+def test_intermediate(tmp_path):
+    returncode, outputs = assert_same_output(tmp_path, 'gen', generated_program(), '-intermediate')
+    assert returncode == 0
+
+
+def test_base_fallback_failures(tmp_path):
+    returncode, outputs = assert_same_output(tmp_path, 'bases', base_fallback, '-diagnostics')
+    assert returncode == 1
+    assert set(outputs) == {'.err.json'}
+
+    errors = outputs['.err.json']
+    assert errors.count('"InstructionError"') == 2
+    assert 'BASE directive has not been not set.' in errors
+    assert 'Neither PC relative or Base relative could be used.' in errors
+    assert '"line": 2' in errors and '"line": 4' in errors
+
+
+def test_base_fallback_success(tmp_path):
+    source = base_fallback.replace('FIRST\tLDA\tFAR\n', 'FIRST\tLDA\tBUF\n')
+    source = source.replace('\tSTA\tFAR\n', '\tSTA\tMID\n')
+
+    returncode, outputs = assert_same_output(tmp_path, 'bases', source)
+    assert returncode == 0
+    assert set(outputs) == {'.obj', '.lst'}
+
+
+def test_fallback_rows_failures(tmp_path):
+    returncode, outputs = assert_same_output(tmp_path, 'rows', fallback_rows, '-diagnostics')
+    assert returncode == 1
+    assert outputs['.err.json'].count('"line"') == 4
+
+
+def test_fallback_rows_success(tmp_path):
+    source = '\n'.join(x for x in fallback_rows.split('\n') if x[-4:] not in ('@FAR', "'05'", '4096', 'NOPE'))
+
+    returncode, outputs = assert_same_output(tmp_path, 'rows', source)
+    assert returncode == 0
+    # +LDA #4000 (hex FA0) gets an M record like with the Python encoder, +LDA #256 (hex 100) does not
+    assert outputs['.obj'].count('\nM') == 2
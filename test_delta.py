@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import pytest
+from delta import load_object
+from error import InputError
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+program = '''PROG\tSTART\t1000
+FIRST\tLDA\tALPHA
+\tSTA\tBETA
+\t+JSUB\tSUB
+BUF\tRESB\t100
+ALPHA\tWORD\t5
+BETA\tRESW\t1
+SUB\tLDA\t#3
+\tRSUB
+\tEND\tFIRST
+'''
+
+# ALPHA changes, and the larger buffer moves every byte after it
+edited = program.replace('WORD\t5', 'WORD\t7').replace('RESB\t100', 'RESB\t120')
+
+
+def run(tmp_path, *args):
+    result = subprocess.run([sys.executable] + list(args), cwd=str(tmp_path),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 0, result.stderr.decode()
+
+
+def assemble(tmp_path, source, *options):
+    (tmp_path / 'prog.asm').write_text(source)
+    run(tmp_path, os.path.join(here, 'assembler.py'), 'prog.asm', '-sicxe', *options)
+
+
+def test_text_records_stop_at_gaps(tmp_path):
+    assemble(tmp_path, program)
+    image = load_object(str(tmp_path / 'prog.obj'))
+
+    # BUF is never loaded, and ALPHA is loaded right after it
+    assert not any(addr in image.memory for addr in range(10, 110))
+    assert [image.memory[addr] for addr in range(110, 113)] == [0, 0, 5]
+
+
+def test_patch_round_trip(tmp_path):
+    assemble(tmp_path, program)
+    os.rename(str(tmp_path / 'prog.obj'), str(tmp_path / 'old.obj'))
+    assemble(tmp_path, edited, '-previous=old.obj')
+    run(tmp_path, os.path.join(here, 'delta.py'), 'old.obj', 'prog.patch', 'new.obj')
+
+    patch = load_object(str(tmp_path / 'prog.patch'))
+    new = load_object(str(tmp_path / 'new.obj'))
+    fresh = load_object(str(tmp_path / 'prog.obj'))
+
+    assert patch.deleted
+    assert new.memory == fresh.memory
+    assert new.modified == fresh.modified
+    assert (new.header, new.end) == (fresh.header, fresh.end)
+
+
+def test_text_record_length_mismatch(tmp_path):
+    path = tmp_path / 'bad.obj'
+    path.write_text('HPROG  000000000006\nT0000000617202D\nE000000')
+
+    with pytest.raises(InputError):
+        load_object(str(path))
@@ -0,0 +1,86 @@
+from instructions import indexed, immediate, indirect, extended, literal
+
+
+class CrossReference(object):
+    def __init__(self):
+        self._definitions = {}
+        self._references = {}
+        self._unused = {}
+
+    def define(self, symbol, line):
+        self._definitions[symbol] = line.lineno
+        self._references.setdefault(symbol, [])
+        if not self._references[symbol]:
+            self._unused[symbol] = line.lineno
+
+    def reference(self, line):
+        symbol = referenced_symbol(line.operand)
+        if symbol is None:
+            return
+
+        self.add(symbol, line.lineno, addressing_mode(line))
+
+    def add(self, symbol, lineno, mode):
+        self._references.setdefault(symbol, []).append((lineno, mode))
+        self._unused.pop(symbol, None)
+
+    def definition(self, symbol):
+        return self._definitions.get(symbol)
+
+    def references(self, symbol):
+        return list(self._references.get(symbol, []))
+
+    def unused(self):
+        return list(self._unused)
+
+    def symbols(self):
+        return list(self._references)
+
+    def output(self, symtab):
+        lines = ['XREF', '{0}{1}{2}{3}'.format(
+            'SYMBOL'.ljust(10), 'VALUE'.ljust(10), 'DEFINED'.ljust(10), 'REFERENCES')]
+
+        for symbol in sorted(self._references):
+            value = symtab.get(symbol)
+            value = '' if value is None else value[2:].zfill(4).upper()
+            defined = self._definitions.get(symbol)
+            defined = '' if defined is None else str(defined)
+            refs = ' '.join('{}({})'.format(n, mode) for n, mode in self._references[symbol])
+            lines.append('{0}{1}{2}{3}'.format(
+                symbol.ljust(10), value.ljust(10), defined.ljust(10), refs))
+
+        return lines
+
+
+def referenced_symbol(operand):
+    if operand is None or literal(operand):
+        return None
+
+    if indexed(operand):
+        symbol = operand[0]
+    elif isinstance(operand, list):
+        return None
+    elif immediate(operand) or indirect(operand):
+        symbol = operand[1:]
+    else:
+        symbol = operand
+
+    return None if symbol.isdigit() else symbol
+
+
+def addressing_mode(line):
+    return mode_name(indexed(line.operand), immediate(line.operand),
+                     indirect(line.operand), extended(line.mnemonic))
+
+
+def mode_name(is_indexed, is_immediate, is_indirect, is_extended):
+    if is_indexed:
+        mode = 'indexed'
+    elif is_immediate:
+        mode = 'immediate'
+    elif is_indirect:
+        mode = 'indirect'
+    else:
+        mode = 'simple'
+
+    return 'extended ' + mode if is_extended else mode